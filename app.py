@@ -8,12 +8,16 @@ Description: A production-ready RAG chatbot with PDF/Text ingestion,
 """
 
 import os
-import json
 import time
 import logging
+import secrets
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
-from flask_session import Session
+import orjson
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 
 from utils.document_processor import DocumentProcessor
@@ -31,27 +35,49 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ─── App Configuration ────────────────────────────────────────────────────────
+class ORJSONProvider(DefaultJSONProvider):
+    """Serialise `jsonify` responses with orjson (several times faster than json)."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
 app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", "rag-chatbot-secret-2024")
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_FILE_DIR"] = "./flask_sessions"
+app.json = ORJSONProvider(app)
+# Only session["session_id"] is stored, so Flask's signed-cookie session suffices.
+# The cookie is only as private as this key: never fall back to a known value.
+app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+if not app.secret_key:
+    app.secret_key = secrets.token_hex(32)
+    logger.warning("FLASK_SECRET_KEY not set; using a random per-process key "
+                   "(sessions reset on restart and are not shared between workers)")
 app.config["UPLOAD_FOLDER"] = "./uploads"
 app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024  # 50 MB
 app.config["ALLOWED_EXTENSIONS"] = {"pdf", "txt"}
-Session(app)
+app.config["INGEST_BATCH_SIZE"] = 200  # chunks per vector-store write
 
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-os.makedirs("./flask_sessions", exist_ok=True)
 os.makedirs("./evaluations", exist_ok=True)
 
 # ─── Global Components ────────────────────────────────────────────────────────
 doc_processor = DocumentProcessor()
-vector_store  = VectorStore(persist_directory="./vector_db")
+vector_store  = VectorStore(
+    persist_directory="./vector_db",
+    query_model=os.environ.get("QUERY_EMBEDDING_MODEL"),
+    compressed_index=os.environ.get("COMPRESSED_INDEX"),  # optional extra index: "ivfpq"
+    # Serve reads from an in-process copy; uploads/deletes here write through to it
+    in_memory=os.environ.get("VECTOR_STORE_IN_MEMORY", "").lower() in ("1", "true", "yes")
+)
 reranker      = Reranker()
 memory        = ConversationMemory(max_turns=10)
 rag_chain     = RAGChain(vector_store=vector_store, reranker=reranker, memory=memory)
 evaluator     = RAGEvaluator()
 
+# File reading / chunking runs off the request thread, one file per worker
+_ingest_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ingest")
+# Evaluation logs are diagnostic; they are written off the request path
+_log_executor    = ThreadPoolExecutor(max_workers=2, thread_name_prefix="evallog")
+
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 def allowed_file(filename: str) -> bool:
@@ -59,11 +85,48 @@ def allowed_file(filename: str) -> bool:
            filename.rsplit(".", 1)[1].lower() in app.config["ALLOWED_EXTENSIONS"]
 
 
+def _ingest_one(file) -> dict:
+    """Save and chunk a single upload. Returns a result entry (+ chunks)."""
+    if not file or not allowed_file(file.filename):
+        return {"filename": file.filename, "status": "skipped – unsupported type"}
+
+    filename = secure_filename(file.filename)
+    # Files are saved in parallel: a private directory per upload keeps
+    # same-named files apart while they're read, and keeps the basename
+    # (the chunks' source)
+    tmp_dir  = tempfile.mkdtemp(dir=app.config["UPLOAD_FOLDER"], prefix=".upload-")
+    filepath = os.path.join(tmp_dir, filename)
+    try:
+        file.save(filepath)
+        chunks = doc_processor.process_file(filepath)
+        os.replace(filepath, os.path.join(app.config["UPLOAD_FOLDER"], filename))
+    except Exception as e:
+        logger.error(f"Error processing {filename}: {e}")
+        return {"filename": filename, "status": f"error: {str(e)}"}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    logger.info(f"Processed {filename}: {len(chunks)} chunks")
+    return {"filename": filename, "status": "success", "chunks": chunks}
+
+
+def _write_eval_log(log_path: str, data: dict, scores: dict, ts: str):
+    try:
+        with open(log_path, "wb") as f:
+            f.write(orjson.dumps(
+                {"input": data, "scores": scores, "ts": ts},
+                option=orjson.OPT_INDENT_2
+            ))
+    except Exception as e:
+        logger.error(f"Failed to write evaluation log {log_path}: {e}")
+
+
 # ─── Routes ───────────────────────────────────────────────────────────────────
 @app.route("/")
 def index():
     if "session_id" not in session:
-        session["session_id"] = f"sess_{int(time.time())}"
+        # Unguessable: the id is the only thing guarding a user's history
+        session["session_id"] = f"sess_{secrets.token_urlsafe(16)}"
     return render_template("index.html")
 
 
@@ -76,27 +139,65 @@ def upload_documents():
     files = request.files.getlist("files")
     results = []
 
-    for file in files:
-        if not file or not allowed_file(file.filename):
-            results.append({"filename": file.filename, "status": "skipped – unsupported type"})
-            continue
-
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(filepath)
+    # Chunks are buffered across files and written in fixed-size batches
+    batch_size = app.config["INGEST_BATCH_SIZE"]
+    batch_texts, batch_metas, batch_ids = [], [], []
+    batch_results = []   # [entry, its chunk count] for entries in the pending batch
+    stored = {}          # id(entry) → chunks already written
 
+    def flush():
         try:
-            chunks = doc_processor.process_file(filepath)
-            vector_store.add_documents(chunks, source=filename)
-            results.append({
-                "filename": filename,
-                "status": "success",
-                "chunks": len(chunks)
-            })
-            logger.info(f"Ingested {filename}: {len(chunks)} chunks")
+            embeddings = vector_store.embed_batch(batch_texts)
+            vector_store.add_documents_batch(batch_texts, batch_metas, batch_ids, embeddings)
         except Exception as e:
-            logger.error(f"Error processing {filename}: {e}")
-            results.append({"filename": filename, "status": f"error: {str(e)}"})
+            logger.error(f"Error writing batch to vector store: {e}")
+            for entry, _ in batch_results:
+                done = stored[id(entry)]
+                if done:
+                    # Earlier batches of this file are already in the store
+                    entry["status"] = f"partial – {done} of {entry['chunks']} chunks stored: {str(e)}"
+                    entry["chunks"] = done
+                else:
+                    entry["status"] = f"error: {str(e)}"
+                    entry.pop("chunks", None)
+        else:
+            for entry, count in batch_results:
+                stored[id(entry)] += count
+                if stored[id(entry)] == entry["chunks"]:
+                    logger.info(f"Ingested {entry['filename']}: {entry['chunks']} chunks")
+        batch_texts.clear()
+        batch_metas.clear()
+        batch_ids.clear()
+        batch_results.clear()
+
+    # Files are read and chunked concurrently; results keep upload order
+    for entry in _ingest_executor.map(_ingest_one, files):
+        results.append(entry)
+        if "chunks" not in entry:
+            continue
+
+        chunks = entry["chunks"]
+        entry["chunks"] = len(chunks)
+        stored[id(entry)] = 0
+        if not chunks:
+            logger.info(f"Ingested {entry['filename']}: 0 chunks")
+        for chunk in chunks:
+            batch_texts.append(chunk.text)
+            batch_metas.append(chunk.metadata)
+            batch_ids.append(vector_store.chunk_id(entry["filename"], chunk.metadata["chunk_idx"]))
+            if not batch_results or batch_results[-1][0] is not entry:
+                batch_results.append([entry, 0])
+            batch_results[-1][1] += 1
+            if len(batch_texts) >= batch_size:
+                flush()
+                if entry["status"] != "success":
+                    break   # don't store the rest of a file whose write failed
+
+    # Final partial batch
+    if batch_texts:
+        flush()
+    # Re-uploaded sources reuse chunk ids, so cached re-rank scores may be stale
+    reranker.clear_cache()
 
     return jsonify({"results": results, "total_docs": vector_store.get_doc_count()})
 
@@ -114,6 +215,9 @@ def chat():
     if not user_message:
         return jsonify({"error": "Empty message"}), 400
 
+    if data.get("stream", False):
+        return _chat_stream(data, user_message, session_id)
+
     try:
         start_time = time.time()
         result = rag_chain.chat(
@@ -140,6 +244,48 @@ def chat():
         return jsonify({"error": str(e)}), 500
 
 
+def _sse(payload: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {app.json.dumps(payload)}\n\n"
+
+
+def _chat_stream(data: dict, user_message: str, session_id: str) -> Response:
+    """
+    Server-Sent Events variant of /api/chat (request body `"stream": true`).
+    Emits a `meta` event (sources / re-ranked chunks), one `data` event per
+    answer token, then a `done` event with timing.
+    """
+    start_time = time.time()
+    try:
+        meta, tokens = rag_chain.chat_stream(
+            query=user_message,
+            session_id=session_id,
+            top_k=int(data.get("top_k", 5)),
+            rerank_top_k=int(data.get("rerank_top_k", 3))
+        )
+    except Exception as e:
+        logger.error(f"Chat error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+    def events():
+        yield _sse(meta, event="meta")
+        try:
+            for token in tokens:
+                if token:
+                    yield _sse({"token": token})
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}", exc_info=True)
+            yield _sse({"error": str(e)}, event="error")
+            return
+        yield _sse({
+            "elapsed_sec": round(time.time() - start_time, 2),
+            "session_id":  session_id,
+            "timestamp":   datetime.now().isoformat()
+        }, event="done")
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
+
+
 @app.route("/api/evaluate", methods=["POST"])
 def evaluate():
     """Run RAGAS-style evaluation on a Q&A pair."""
@@ -155,10 +301,9 @@ def evaluate():
             contexts=data["contexts"],
             ground_truth=data.get("ground_truth", "")
         )
-        # Persist evaluation log
+        # Persist evaluation log (in the background; response doesn't wait)
         log_path = f"./evaluations/eval_{int(time.time())}.json"
-        with open(log_path, "w") as f:
-            json.dump({"input": data, "scores": scores, "ts": datetime.now().isoformat()}, f, indent=2)
+        _log_executor.submit(_write_eval_log, log_path, data, scores, datetime.now().isoformat())
 
         return jsonify({"scores": scores, "log": log_path})
     except Exception as e:
@@ -208,6 +353,7 @@ def delete_document(source):
     """Delete a document from the vector store."""
     try:
         vector_store.delete_source(source)
+        reranker.clear_cache()
         return jsonify({"message": f"Deleted: {source}"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -7,11 +7,54 @@ Handles PDF and TXT file ingestion with smart chunking.
 import os
 import re
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 from dataclasses import dataclass
 
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # optional: without numba the kernel runs as plain Python
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
 logger = logging.getLogger(__name__)
 
+_WS_RE       = re.compile(r'\s+')
+_NONASCII_RE = re.compile(r'[^\x00-\x7F]+')
+_DOTS_RE     = re.compile(r'\.{3,}')
+_SENT_RE     = re.compile(r'(?<=[.!?])\s+')
+
+
+@njit(cache=True)
+def _window_chunks(sentence_lens, open_len, chunk_size, chunk_overlap):
+    """
+    Plan sliding-window chunks from sentence lengths alone.
+
+    `open_len` is the joined length of the still-open window carried in
+    from earlier text (0 if none); sentences are joined by single spaces.
+    Returns `(bounds, open_len)`: an (n, 2) int64 array of [start, end)
+    sentence ranges, one per chunk closed here (the first also includes
+    the carried window), and the open window's length afterwards.
+    """
+    n     = sentence_lens.shape[0]
+    out   = np.empty((n, 2), dtype=np.int64)
+    k     = 0
+    cur   = open_len
+    start = 0
+    for i in range(n):
+        s_len = sentence_lens[i]
+        if cur > 0 and cur + 1 + s_len > chunk_size:
+            out[k, 0] = start
+            out[k, 1] = i
+            k += 1
+            cur   = min(chunk_overlap, cur)   # overlap carried into next chunk
+            start = i
+        if cur > 0:
+            cur += 1
+        cur += s_len
+    return out[:k], cur
+
 
 @dataclass
 class DocumentChunk:
@@ -34,29 +77,28 @@ class DocumentProcessor:
     def process_file(self, filepath: str) -> List[DocumentChunk]:
         ext = os.path.splitext(filepath)[1].lower()
         if ext == ".pdf":
-            text = self._read_pdf(filepath)
+            # Pages are cleaned and chunked one at a time, never concatenated
+            segments = self._iter_pdf_pages(filepath)
         elif ext == ".txt":
-            text = self._read_txt(filepath)
+            segments = [self._clean_text(self._read_txt(filepath))]
         else:
             raise ValueError(f"Unsupported file type: {ext}")
 
-        text   = self._clean_text(text)
-        chunks = self._split_text(text, source=os.path.basename(filepath))
+        chunks = self._split_text(segments, source=os.path.basename(filepath))
         logger.info(f"Processed '{filepath}' → {len(chunks)} chunks")
         return chunks
 
     # ── Private helpers ────────────────────────────────────────────────────────
 
-    def _read_pdf(self, filepath: str) -> str:
+    def _iter_pdf_pages(self, filepath: str) -> Iterator[str]:
+        """Yield the cleaned text of each non-empty PDF page."""
         try:
             import pypdf
             reader = pypdf.PdfReader(filepath)
-            pages  = []
             for i, page in enumerate(reader.pages):
                 page_text = page.extract_text() or ""
                 if page_text.strip():
-                    pages.append(f"[Page {i+1}]\n{page_text}")
-            return "\n\n".join(pages)
+                    yield self._clean_text(f"[Page {i+1}]\n{page_text}")
         except ImportError:
             raise ImportError("Install pypdf: pip install pypdf")
         except Exception as e:
@@ -73,48 +115,27 @@ class DocumentProcessor:
         raise RuntimeError(f"Cannot decode {filepath}")
 
     def _clean_text(self, text: str) -> str:
-        text = re.sub(r'\s+', ' ', text)           # collapse whitespace
-        text = re.sub(r'[^\x00-\x7F]+', ' ', text) # strip non-ASCII
-        text = re.sub(r'\.{3,}', '…', text)        # ellipsis
+        text = _WS_RE.sub(' ', text)        # collapse whitespace
+        text = _NONASCII_RE.sub(' ', text)  # strip non-ASCII
+        text = _DOTS_RE.sub('…', text)      # ellipsis
         text = text.strip()
         return text
 
-    def _split_text(self, text: str, source: str) -> List[DocumentChunk]:
+    def _split_text(self, segments: Iterable[str], source: str) -> List[DocumentChunk]:
         """
         Sentence-aware sliding-window chunking.
         Tries to split on sentence boundaries before hard-cutting.
+
+        `segments` are consecutive pieces of cleaned text (e.g. PDF pages);
+        the window runs across segment boundaries.
         """
-        # Split into sentences first
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        
         chunks   = []
-        current  = []
-        curr_len = 0
-
-        for sentence in sentences:
-            s_len = len(sentence)
-            if curr_len + s_len > self.chunk_size and current:
-                chunk_text = " ".join(current).strip()
-                if chunk_text:
-                    chunks.append(DocumentChunk(
-                        text=chunk_text,
-                        metadata={
-                            "source":     source,
-                            "chunk_idx":  len(chunks),
-                            "char_count": len(chunk_text)
-                        }
-                    ))
-                # Overlap: keep last N chars worth of sentences
-                overlap_text = chunk_text[-self.chunk_overlap:]
-                current  = [overlap_text]
-                curr_len = len(overlap_text)
-
-            current.append(sentence)
-            curr_len += s_len + 1
+        window   = []   # open chunk: carried overlap text + sentences
+        open_len = 0    # len(" ".join(window))
 
-        # Flush remaining
-        if current:
-            chunk_text = " ".join(current).strip()
+        def emit(window: List[str]) -> str:
+            raw        = " ".join(window)
+            chunk_text = raw.strip()
             if chunk_text:
                 chunks.append(DocumentChunk(
                     text=chunk_text,
@@ -124,5 +145,22 @@ class DocumentProcessor:
                         "char_count": len(chunk_text)
                     }
                 ))
+            # Overlap: keep last N chars worth of sentences
+            return raw[-self.chunk_overlap:] if self.chunk_overlap else ""
+
+        for segment in segments:
+            sentences = [s for s in _SENT_RE.split(segment) if s]
+            lens      = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+            bounds, open_len = _window_chunks(
+                lens, open_len, self.chunk_size, self.chunk_overlap
+            )
+            # The kernel only does the length arithmetic; each chunk is joined once
+            for start, end in bounds:
+                overlap_text = emit(window + sentences[start:end])
+                window = [overlap_text] if overlap_text else []
+            window.extend(sentences[bounds[-1][1] if len(bounds) else 0:])
+
+        # Flush remaining
+        emit(window)
 
         return chunks
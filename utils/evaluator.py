@@ -13,11 +13,20 @@ Implements RAGAS-inspired evaluation metrics without requiring the full RAGAS li
 import re
 import math
 import logging
-from typing import List, Dict, Any, Optional
-from collections import Counter
+from typing import List, Dict, Any, Optional, Set
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+_TOK_RE  = re.compile(r'\b[a-z]{2,}\b')
+# Question tokens minus stop words, in one pass (the lookahead rejects them)
+_Q_TOK_RE = re.compile(
+    r'\b(?!(?:what|is|the|an|of|in|to|how|does|do|can|who|when|where|why|which)\b)'
+    r'[a-z]{2,}\b'
+)
+_SENT_RE = re.compile(r'(?<=[.!?])\s+')
+
 
 class RAGEvaluator:
     """
@@ -40,13 +49,27 @@ class RAGEvaluator:
         """
         scores = {}
 
-        scores["faithfulness"]      = self._faithfulness(answer, contexts)
-        scores["answer_relevancy"]  = self._answer_relevancy(question, answer)
-        scores["context_precision"] = self._context_precision(question, contexts)
-        scores["context_recall"]    = self._context_recall(contexts, ground_truth) if ground_truth else None
+        # Tokenize each input once; metrics share the results
+        q_tokens   = set(self._tokenize(question))
+        a_list     = self._tokenize(answer)
+        a_tokens   = set(a_list)
+        ctx_tokens = set(self._tokenize(" ".join(contexts)))
+        gt_list    = self._tokenize(ground_truth) if ground_truth else []
+
+        scores["faithfulness"]      = self._faithfulness(answer, contexts, ctx_tokens=ctx_tokens)
+        scores["answer_relevancy"]  = self._answer_relevancy(
+            question, answer,
+            q_tokens=set(self._tokenize_question(question)), a_tokens=a_tokens
+        )
+        scores["context_precision"] = self._context_precision(question, contexts, q_tokens=q_tokens)
+        scores["context_recall"]    = self._context_recall(
+            contexts, ground_truth, gt_tokens=set(gt_list), ctx_tokens=ctx_tokens
+        ) if ground_truth else None
 
         if ground_truth:
-            scores["answer_correctness"] = self._answer_correctness(answer, ground_truth)
+            scores["answer_correctness"] = self._answer_correctness(
+                answer, ground_truth, a_list=a_list, gt_list=gt_list
+            )
 
         # Aggregate (exclude None values)
         valid = [v for v in scores.values() if v is not None]
@@ -68,7 +91,12 @@ class RAGEvaluator:
 
     # ── Metric Implementations ─────────────────────────────────────────────────
 
-    def _faithfulness(self, answer: str, contexts: List[str]) -> float:
+    def _faithfulness(
+        self,
+        answer: str,
+        contexts: List[str],
+        ctx_tokens: Optional[Set[str]] = None
+    ) -> float:
         """
         Measures how much of the answer is grounded in the contexts.
         Heuristic: overlap of answer sentences with any context chunk.
@@ -80,31 +108,37 @@ class RAGEvaluator:
         if not answer_sentences:
             return 0.0
 
-        combined_context = " ".join(contexts).lower()
+        if ctx_tokens is None:
+            ctx_tokens = set(self._tokenize(" ".join(contexts)))
         supported = 0
         for sent in answer_sentences:
             tokens = set(self._tokenize(sent))
             # Check if key tokens appear in context
-            if tokens and len(tokens & set(self._tokenize(combined_context))) / len(tokens) > 0.5:
+            if tokens and len(tokens & ctx_tokens) / len(tokens) > 0.5:
                 supported += 1
 
         return round(supported / len(answer_sentences), 4)
 
-    def _answer_relevancy(self, question: str, answer: str) -> float:
+    def _answer_relevancy(
+        self,
+        question: str,
+        answer: str,
+        q_tokens: Optional[Set[str]] = None,
+        a_tokens: Optional[Set[str]] = None
+    ) -> float:
         """
         Measures how relevant the answer is to the question.
         Heuristic: token overlap between question and answer.
+        `q_tokens`, if given, must already exclude stop words.
         """
         if not question or not answer:
             return 0.0
 
-        q_tokens = set(self._tokenize(question))
-        a_tokens = set(self._tokenize(answer))
-
-        # Stop words that don't count
-        stopwords = {"what", "is", "the", "a", "an", "of", "in", "to", "how",
-                     "does", "do", "can", "who", "when", "where", "why", "which"}
-        q_tokens -= stopwords
+        # Stop words don't count
+        if q_tokens is None:
+            q_tokens = set(self._tokenize_question(question))
+        if a_tokens is None:
+            a_tokens = set(self._tokenize(answer))
 
         if not q_tokens:
             return 0.5
@@ -118,14 +152,20 @@ class RAGEvaluator:
 
         return round(score, 4)
 
-    def _context_precision(self, question: str, contexts: List[str]) -> float:
+    def _context_precision(
+        self,
+        question: str,
+        contexts: List[str],
+        q_tokens: Optional[Set[str]] = None
+    ) -> float:
         """
         Measures what fraction of retrieved chunks are relevant to the question.
         """
         if not contexts:
             return 0.0
 
-        q_tokens = set(self._tokenize(question))
+        if q_tokens is None:
+            q_tokens = set(self._tokenize(question))
         if not q_tokens:
             return 0.5
 
@@ -138,16 +178,23 @@ class RAGEvaluator:
 
         return round(relevant / len(contexts), 4)
 
-    def _context_recall(self, contexts: List[str], ground_truth: str) -> float:
+    def _context_recall(
+        self,
+        contexts: List[str],
+        ground_truth: str,
+        gt_tokens: Optional[Set[str]] = None,
+        ctx_tokens: Optional[Set[str]] = None
+    ) -> float:
         """
         Measures whether the context contains enough info to answer the ground truth.
         """
         if not ground_truth or not contexts:
             return 0.0
 
-        gt_tokens      = set(self._tokenize(ground_truth))
-        combined_ctx   = " ".join(contexts)
-        ctx_tokens     = set(self._tokenize(combined_ctx))
+        if gt_tokens is None:
+            gt_tokens = set(self._tokenize(ground_truth))
+        if ctx_tokens is None:
+            ctx_tokens = set(self._tokenize(" ".join(contexts)))
 
         if not gt_tokens:
             return 0.5
@@ -155,29 +202,46 @@ class RAGEvaluator:
         recall = len(gt_tokens & ctx_tokens) / len(gt_tokens)
         return round(min(recall, 1.0), 4)
 
-    def _answer_correctness(self, answer: str, ground_truth: str) -> float:
+    def _answer_correctness(
+        self,
+        answer: str,
+        ground_truth: str,
+        a_list: Optional[List[str]] = None,
+        gt_list: Optional[List[str]] = None
+    ) -> float:
         """
         F1-based token overlap between answer and ground truth.
         """
         if not ground_truth or not answer:
             return 0.0
 
-        a_tokens  = Counter(self._tokenize(answer))
-        gt_tokens = Counter(self._tokenize(ground_truth))
+        if a_list is None:
+            a_list = self._tokenize(answer)
+        if gt_list is None:
+            gt_list = self._tokenize(ground_truth)
 
-        common = sum((a_tokens & gt_tokens).values())
+        a_tok, a_cnt = np.unique(a_list, return_counts=True)
+        g_tok, g_cnt = np.unique(gt_list, return_counts=True)
+
+        # Multiset intersection: per shared token, the smaller of the two counts
+        _, ai, gi = np.intersect1d(a_tok, g_tok, assume_unique=True, return_indices=True)
+        common = int(np.minimum(a_cnt[ai], g_cnt[gi]).sum())
         if common == 0:
             return 0.0
 
-        precision = common / sum(a_tokens.values())
-        recall    = common / sum(gt_tokens.values())
+        precision = common / int(a_cnt.sum())
+        recall    = common / int(g_cnt.sum())
         f1        = 2 * precision * recall / (precision + recall)
         return round(f1, 4)
 
     # ── Utility ────────────────────────────────────────────────────────────────
 
     def _tokenize(self, text: str) -> List[str]:
-        return re.findall(r'\b[a-z]{2,}\b', text.lower())
+        return _TOK_RE.findall(text.lower())
+
+    def _tokenize_question(self, text: str) -> List[str]:
+        """Like `_tokenize`, but stop words never enter the token list."""
+        return _Q_TOK_RE.findall(text.lower())
 
     def _split_sentences(self, text: str) -> List[str]:
-        return [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+        return [s.strip() for s in _SENT_RE.split(text) if s.strip()]
@@ -6,7 +6,8 @@ Supports summary compression for very long conversations.
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+from itertools import count, islice
+from typing import List, Dict, Any, Optional, Tuple
 from collections import deque
 from datetime import datetime
 
@@ -27,6 +28,12 @@ class ConversationMemory:
         self.max_turns = max_turns
         # session_id → deque of {"role": ..., "content": ..., "ts": ...}
         self._sessions: Dict[str, deque] = {}
+        # session_id → version, bumped on every add_turn / clear. Versions come
+        # from one process-wide counter, so a value is never reused.
+        self._versions: Dict[str, int] = {}
+        self._version_counter = count(1)
+        # session_id → (version, max_chars, formatted context)
+        self._formatted_cache: Dict[str, Tuple[int, int, str]] = {}
 
     # ── Public API ─────────────────────────────────────────────────────────────
 
@@ -40,6 +47,8 @@ class ConversationMemory:
             "content": content,
             "ts":      datetime.now().isoformat()
         })
+        self._versions[session_id] = next(self._version_counter)
+        self._formatted_cache.pop(session_id, None)
 
     def get_history(self, session_id: str) -> List[Dict[str, str]]:
         """Return full turn history for a session."""
@@ -50,30 +59,49 @@ class ConversationMemory:
         Return conversation history as a formatted string for LLM prompts.
         Truncates from the oldest end if exceeding max_chars.
         """
-        history = self.get_history(session_id)
+        # Read the version before the history: if a turn lands in between, the
+        # result is cached under the older version and simply never served
+        version = self._versions.get(session_id)
+        history = self._sessions.get(session_id)
         if not history:
             return ""
 
-        lines = []
-        for turn in history:
+        cached = self._formatted_cache.get(session_id)
+        if cached and cached[0] == version and cached[1] == max_chars:
+            return cached[2]
+
+        # Format newest → oldest and stop once the tail alone exceeds max_chars;
+        # older turns would be truncated away anyway
+        lines, total = [], -1
+        for turn in reversed(list(history)):  # snapshot; other requests may append
             role    = "Human" if turn["role"] == "user" else "Assistant"
             content = turn["content"][:500]  # cap per-turn
             lines.append(f"{role}: {content}")
+            total += len(lines[-1]) + 1
+            if total > max_chars:
+                break
 
-        full_context = "\n".join(lines)
-        if len(full_context) > max_chars:
+        full_context = "\n".join(reversed(lines))
+        if total > max_chars:
             full_context = "...[truncated]\n" + full_context[-max_chars:]
 
+        self._formatted_cache[session_id] = (version, max_chars, full_context)
         return full_context
 
     def get_recent_messages(self, session_id: str, n: int = 4) -> List[Dict]:
         """Return the last N messages (for LLM API message arrays)."""
-        history = self.get_history(session_id)
-        return [{"role": m["role"], "content": m["content"]} for m in history[-n:]]
+        history = self._sessions.get(session_id)
+        if not history or n <= 0:
+            return []
+        # Walk only the tail of the deque instead of copying all of it
+        tail = list(islice(reversed(history), n))
+        return [{"role": m["role"], "content": m["content"]} for m in reversed(tail)]
 
     def clear(self, session_id: str):
         """Clear memory for a session."""
         self._sessions.pop(session_id, None)
+        self._versions.pop(session_id, None)
+        self._formatted_cache.pop(session_id, None)
         logger.info(f"Memory cleared for session: {session_id}")
 
     def session_count(self) -> int:
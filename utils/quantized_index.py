@@ -0,0 +1,186 @@
+"""
+Quantized Index
+===============
+A compact in-memory copy of the vector store's embeddings, used to answer
+unfiltered similarity queries instead of Chroma's HNSW index.
+
+  PQIndex – Faiss IVF + product quantization (48 bytes per 384-d vector),
+            trained once enough vectors exist; requires faiss-cpu.
+
+This is an additional index: Chroma keeps its full-precision float32 HNSW
+index loaded, so enabling it adds about 1⁄32 of the float32 vectors in
+memory rather than saving any. What it buys is IVF search, which visits a
+few inverted lists per query instead of walking the whole graph.
+
+Scores are approximate inner products, clipped to the cosine range [-1, 1].
+"""
+
+import logging
+import threading
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PQIndex:
+    """
+    Inner-product IVF-PQ index (faiss.IndexIVFPQ) over L2-normalised vectors.
+
+    PQ codebooks need a representative sample, so vectors are held as exact
+    float32 rows (and searched exhaustively) until TRAIN_THRESHOLD of them
+    exist. The index is then trained on a snapshot of those rows on a
+    background thread while the exact rows keep serving; once trained it is
+    swapped in under the lock, together with any adds and removes made in
+    the meantime, and the float copy is dropped. Later vectors are encoded
+    straight into the trained index.
+    """
+
+    TRAIN_THRESHOLD = 10000   # vectors required before training IVF-PQ
+    NPROBE          = 16      # inverted lists visited per query
+    NBITS           = 8       # bits per sub-quantizer code
+
+    def __init__(self, dim: int):
+        import faiss   # optional dependency: pip install faiss-cpu
+        self._faiss  = faiss
+        self.dim     = dim
+        self._index  = None          # faiss index once trained
+        self._quantizer = None       # coarse quantizer (IndexIVF doesn't own it)
+        self._vecs   = np.empty((1024, dim), dtype=np.float32)   # pre-training rows
+        self._n      = 0                                          # rows used in _vecs
+        self._row_ids: List[int] = []                             # faiss id per row
+        self._to_int: Dict[str, int] = {}   # chunk id → faiss int64 id
+        self._to_str: Dict[int, str] = {}
+        self._next_id  = 0
+        self._train_at = self.TRAIN_THRESHOLD
+        self._trainer: Optional[threading.Thread] = None
+        self._lock     = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._to_int)
+
+    def add(self, ids: List[str], embeddings: np.ndarray):
+        """Insert or overwrite vectors by id."""
+        if not ids:
+            return
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._remove_locked([i for i in ids if i in self._to_int])
+            int_ids = np.arange(self._next_id, self._next_id + len(ids), dtype=np.int64)
+            self._next_id += len(ids)
+            for doc_id, int_id in zip(ids, int_ids.tolist()):
+                self._to_int[doc_id] = int_id
+                self._to_str[int_id] = doc_id
+
+            if self._index is not None:
+                self._index.add_with_ids(vectors, int_ids)
+                return
+            self._append_locked(vectors, int_ids.tolist())
+            if self._n >= self._train_at and self._trainer is None:
+                self._trainer = threading.Thread(
+                    target=self._train,
+                    args=(self._vecs[:self._n].copy(), list(self._row_ids), self._next_id),
+                    name="pq-train",
+                    daemon=True,
+                )
+                self._trainer.start()
+
+    def remove(self, ids: List[str]):
+        """Drop vectors by id (unknown ids are ignored)."""
+        with self._lock:
+            self._remove_locked(ids)
+
+    def search(self, query: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """Return up to top_k (id, approx. inner product) pairs, best first."""
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            if not self._to_int or top_k <= 0:
+                return []
+            k = min(top_k, len(self._to_int))
+            if self._index is not None:
+                scores, found = self._index.search(query[None, :], k)
+                scores, found = scores[0], found[0]
+            else:
+                all_scores = self._vecs[:self._n] @ query
+                top    = np.argpartition(-all_scores, k - 1)[:k]
+                top    = top[np.argsort(-all_scores[top], kind="stable")]
+                scores = all_scores[top]
+                found  = np.asarray(self._row_ids, dtype=np.int64)[top]
+            return [
+                (self._to_str[int_id], float(score))
+                for int_id, score in zip(found.tolist(), np.clip(scores, -1.0, 1.0).tolist())
+                if int_id != -1
+            ]
+
+    # ── Internals ─────────────────────────────────────────────────────────────
+
+    def _append_locked(self, vectors: np.ndarray, int_ids: List[int]):
+        # Grow by doubling so buffering N rows costs O(N) copies, not O(N²)
+        needed = self._n + len(vectors)
+        if needed > len(self._vecs):
+            grown = np.empty((max(needed, 2 * len(self._vecs)), self.dim), dtype=np.float32)
+            grown[:self._n] = self._vecs[:self._n]
+            self._vecs = grown
+        self._vecs[self._n:needed] = vectors
+        self._n = needed
+        self._row_ids.extend(int_ids)
+
+    def _remove_locked(self, ids: List[str]):
+        int_ids = [self._to_int.pop(i) for i in ids if i in self._to_int]
+        if not int_ids:
+            return
+        for int_id in int_ids:
+            del self._to_str[int_id]
+
+        if self._index is not None:
+            self._index.remove_ids(np.asarray(int_ids, dtype=np.int64))
+            return
+        drop = set(int_ids)
+        keep = np.fromiter((r not in drop for r in self._row_ids), dtype=bool, count=self._n)
+        kept = int(keep.sum())
+        self._vecs[:kept] = self._vecs[:self._n][keep]
+        self._n       = kept
+        self._row_ids = [r for r, k in zip(self._row_ids, keep) if k]
+
+    def _train(self, vectors: np.ndarray, row_ids: List[int], snapshot_next_id: int):
+        """Train on a snapshot off the lock, then swap the index in under it."""
+        faiss = self._faiss
+        n     = len(row_ids)
+        # ~4·√n lists, keeping ≥ 39 training points per centroid
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        m     = next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if self.dim % m == 0)
+
+        try:
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index     = faiss.IndexIVFPQ(quantizer, self.dim, nlist, m, self.NBITS, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            index.add_with_ids(vectors, np.asarray(row_ids, dtype=np.int64))
+            index.nprobe = min(self.NPROBE, nlist)
+        except Exception as e:
+            logger.warning(f"IVF-PQ training failed ({e}); serving exact search")
+            with self._lock:
+                self._train_at = 2 * max(self._n, self.TRAIN_THRESHOLD)   # retry later
+                self._trainer  = None
+            return
+
+        with self._lock:
+            # Replay what changed while training: drop snapshot rows removed
+            # (or overwritten) since, add rows that arrived after the snapshot
+            stale = [r for r in row_ids if r not in self._to_str]
+            if stale:
+                index.remove_ids(np.asarray(stale, dtype=np.int64))
+            late = [i for i, r in enumerate(self._row_ids) if r >= snapshot_next_id]
+            if late:
+                index.add_with_ids(
+                    np.ascontiguousarray(self._vecs[:self._n][late]),
+                    np.asarray([self._row_ids[i] for i in late], dtype=np.int64),
+                )
+
+            self._index     = index
+            self._quantizer = quantizer
+            self._vecs      = np.empty((0, self.dim), dtype=np.float32)
+            self._n         = 0
+            self._row_ids   = []
+            self._trainer   = None
+        logger.info(f"Trained IVF-PQ index: {n} vectors | nlist={nlist} | m={m}")
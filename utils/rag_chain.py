@@ -11,7 +11,7 @@ Supports:
 
 import os
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator, Tuple, Union
 
 from utils.vector_store import VectorStore
 from utils.reranker import Reranker
@@ -35,6 +35,11 @@ Guidelines:
 class RAGChain:
     """End-to-end RAG pipeline: Retrieve → Re-rank → Generate."""
 
+    # Only the first-stage top-N ("protected set") goes through the
+    # cross-encoder, N = RERANK_POOL_FACTOR × rerank_top_k, so raising top_k
+    # doesn't raise re-ranking cost
+    RERANK_POOL_FACTOR = 3
+
     def __init__(
         self,
         vector_store: VectorStore,
@@ -78,31 +83,21 @@ class RAGChain:
         """
         Full RAG pipeline:
         1. Retrieve top-k candidates from vector store
-        2. Re-rank with cross-encoder
+        2. Re-rank the first-stage top-N with cross-encoder
         3. Build prompt with memory + context
         4. Generate answer with LLM
         5. Update memory
         """
 
-        # ── Step 1: Retrieve ──────────────────────────────────────────────────
-        candidates = self.vector_store.similarity_search(query=query, top_k=top_k)
-        logger.info(f"Retrieved {len(candidates)} candidates for query: '{query[:60]}...'")
-
-        # ── Step 2: Re-rank ───────────────────────────────────────────────────
-        if candidates:
-            reranked = self.reranker.rerank(query, candidates, top_k=rerank_top_k)
-        else:
-            reranked = []
-
-        # ── Step 3: Build context ─────────────────────────────────────────────
-        context_text   = self._build_context(reranked)
-        history_text   = self.memory.get_formatted_context(session_id)
-        recent_messages = self.memory.get_recent_messages(session_id, n=6)
+        # ── Steps 1–2: Retrieve + re-rank ─────────────────────────────────────
+        reranked, history_text, recent_messages = self._retrieve(
+            query, session_id, top_k, rerank_top_k
+        )
 
-        # ── Step 4: Generate ──────────────────────────────────────────────────
+        # ── Steps 3–4: Build context + generate ───────────────────────────────
         answer = self._generate(
             query=query,
-            context=context_text,
+            context=self._build_context(reranked),
             history=history_text,
             recent_messages=recent_messages
         )
@@ -111,14 +106,78 @@ class RAGChain:
         self.memory.add_turn(session_id, "user", query)
         self.memory.add_turn(session_id, "assistant", answer)
 
-        # ── Build response ────────────────────────────────────────────────────
+        result = self._format_result(reranked)
+        result["answer"] = answer
+        return result
+
+    def chat_stream(
+        self,
+        query: str,
+        session_id: str,
+        top_k: int = 5,
+        rerank_top_k: int = 3
+    ) -> Tuple[Dict[str, Any], Iterator[str]]:
+        """
+        Streaming variant of `chat`.
+
+        Retrieval and re-ranking run eagerly; returns the source metadata
+        together with a generator of answer tokens. Memory is updated once
+        the generator has been fully consumed.
+        """
+        reranked, history_text, recent_messages = self._retrieve(
+            query, session_id, top_k, rerank_top_k
+        )
+        tokens = self._generate(
+            query=query,
+            context=self._build_context(reranked),
+            history=history_text,
+            recent_messages=recent_messages,
+            stream=True
+        )
+
+        def stream() -> Iterator[str]:
+            parts = []
+            for token in tokens:
+                parts.append(token)
+                yield token
+            self.memory.add_turn(session_id, "user", query)
+            self.memory.add_turn(session_id, "assistant", "".join(parts).strip())
+
+        return self._format_result(reranked), stream()
+
+    # ── Helpers ────────────────────────────────────────────────────────────────
+
+    def _retrieve(
+        self,
+        query: str,
+        session_id: str,
+        top_k: int,
+        rerank_top_k: int
+    ) -> Tuple[List[Dict], str, List[Dict]]:
+        """Retrieve + re-rank; returns (reranked docs, history text, recent messages)."""
+        # Runs on the request thread: a shared pool would cap concurrent searches
+        # app-wide, and the memory reads are cheap in-process lookups
+        candidates = self.vector_store.similarity_search(query=query, top_k=top_k)
+        logger.info(f"Retrieved {len(candidates)} candidates for query: '{query[:60]}...'")
+
+        # Re-rank the protected top-N only
+        if candidates:
+            pool     = candidates[:self.RERANK_POOL_FACTOR * rerank_top_k]
+            reranked = self.reranker.rerank(query, pool, top_k=rerank_top_k)
+        else:
+            reranked = []
+
+        history = self.memory.get_formatted_context(session_id)
+        recent  = self.memory.get_recent_messages(session_id, n=6)
+        return reranked, history, recent
+
+    def _format_result(self, reranked: List[Dict]) -> Dict[str, Any]:
         sources = list({
             c["metadata"].get("source", "unknown")
             for c in reranked
         })
 
         return {
-            "answer":       answer,
             "sources":      sources,
             "context_used": [c["text"][:200] + "…" for c in reranked],
             "reranked":     [
@@ -132,8 +191,6 @@ class RAGChain:
             ]
         }
 
-    # ── Helpers ────────────────────────────────────────────────────────────────
-
     def _build_context(self, documents: List[Dict]) -> str:
         if not documents:
             return "No relevant documents found in the knowledge base."
@@ -148,9 +205,14 @@ class RAGChain:
         query: str,
         context: str,
         history: str,
-        recent_messages: List[Dict]
-    ) -> str:
-        """Generate an answer using the configured LLM provider."""
+        recent_messages: List[Dict],
+        stream: bool = False
+    ) -> Union[str, Iterator[str]]:
+        """
+        Generate an answer using the configured LLM provider.
+        With stream=True returns an iterator of text pieces instead; providers
+        without streaming support yield their full answer as a single piece.
+        """
 
         user_prompt = f"""Context from knowledge base:
 {context}
@@ -162,13 +224,19 @@ Question: {query}
 Answer based strictly on the context above:"""
 
         if self.llm_provider == "openai" and self._llm_client:
-            return self._call_openai(user_prompt, recent_messages)
+            return self._call_openai(user_prompt, recent_messages, stream=stream)
         elif self.llm_provider == "ollama":
-            return self._call_ollama(user_prompt)
+            answer = self._call_ollama(user_prompt)
         else:
-            return self._mock_response(query, context)
+            answer = self._mock_response(query, context)
+        return iter([answer]) if stream else answer
 
-    def _call_openai(self, user_prompt: str, recent_messages: List[Dict]) -> str:
+    def _call_openai(
+        self,
+        user_prompt: str,
+        recent_messages: List[Dict],
+        stream: bool = False
+    ) -> Union[str, Iterator[str]]:
         model = os.environ.get("LLM_MODEL", "gpt-4.1-mini")
         messages = [{"role": "system", "content": SYSTEM_PROMPT}]
         messages.extend(recent_messages)
@@ -178,12 +246,25 @@ Answer based strictly on the context above:"""
                 model=model,
                 messages=messages,
                 temperature=0.3,
-                max_tokens=1024
+                max_tokens=1024,
+                stream=stream
             )
+            if stream:
+                return self._iter_openai_stream(response)
             return response.choices[0].message.content.strip()
         except Exception as e:
             logger.error(f"OpenAI call failed: {e}")
-            return f"LLM error: {e}"
+            return iter([f"LLM error: {e}"]) if stream else f"LLM error: {e}"
+
+    def _iter_openai_stream(self, response) -> Iterator[str]:
+        """Yield content deltas from a streamed chat completion."""
+        try:
+            for chunk in response:
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ""
+        except Exception as e:
+            logger.error(f"OpenAI stream failed: {e}")
+            yield f"\n\nLLM error: {e}"
 
     def _call_ollama(self, user_prompt: str) -> str:
         import requests
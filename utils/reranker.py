@@ -8,8 +8,15 @@ Pipeline:
   Bi-encoder retrieval (fast, approximate)  →  Cross-encoder re-ranking (slow, precise)
 """
 
+import os
+import heapq
 import logging
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, nullcontext
+from typing import List, Dict, Any, Tuple, Optional
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -24,28 +31,106 @@ class Reranker:
     """
 
     DEFAULT_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    # Tried in order for backend="onnx"; O3 is the best CPU graph optimisation
+    ONNX_FILES    = ["onnx/model_qint8_avx512_vnni.onnx", "onnx/model_O3.onnx"]
+    CACHE_SIZE    = 4096   # cached (query, chunk) scores (LRU)
 
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, backend: str = "onnx"):
         self.model_name = model_name or self.DEFAULT_MODEL
+        self.backend    = backend   # "onnx" | "openvino" | "torch"
+        self.device     = "cpu"
+        self._amp_dtype = None      # autocast dtype when running on CUDA
         self._model     = None
+        # (hash(query), "source:chunk_idx") → raw cross-encoder score
+        self._cache: "OrderedDict[Tuple[int, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
         self._load_model()
 
     def _load_model(self):
         try:
             from sentence_transformers import CrossEncoder
-            self._model = CrossEncoder(self.model_name, max_length=512)
-            logger.info(f"Re-ranker loaded: {self.model_name}")
+            self._set_torch_threads()
+            self._detect_device()
+            self._model = self._load_backend(CrossEncoder)
+            logger.info(
+                f"Re-ranker loaded: {self.model_name} | backend={self.backend} "
+                f"| device={self.device}"
+            )
+            self.warmup()
         except ImportError:
             raise ImportError("Install sentence-transformers: pip install sentence-transformers")
         except Exception as e:
             logger.warning(f"Re-ranker load failed ({e}), will use score pass-through")
             self._model = None
 
+    @staticmethod
+    def _set_torch_threads():
+        """
+        Let PyTorch use every core for intra-op parallelism. For finer control
+        set OMP_NUM_THREADS / MKL_NUM_THREADS in the environment before start-up
+        (e.g. to the number of physical cores when several workers share a host).
+        """
+        try:
+            import torch
+            if "OMP_NUM_THREADS" not in os.environ:
+                torch.set_num_threads(os.cpu_count() or 1)
+        except ImportError:
+            pass
+
+    def _detect_device(self):
+        """Use CUDA with bf16/fp16 autocast when a GPU is available."""
+        try:
+            import torch
+        except ImportError:
+            return
+        if not torch.cuda.is_available():
+            return
+
+        self.device     = "cuda"
+        self._amp_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        if self.backend != "torch":
+            # The ONNX/OpenVINO exports here are CPU-targeted (int8 / AVX-512)
+            logger.info(f"CUDA available: using PyTorch backend instead of {self.backend}")
+            self.backend = "torch"
+
+    def _autocast(self):
+        """Mixed-precision inference context on CUDA; no-op on CPU."""
+        if self.device != "cuda":
+            return nullcontext()
+        import torch
+        stack = ExitStack()
+        stack.enter_context(torch.inference_mode())
+        stack.enter_context(torch.autocast(device_type="cuda", dtype=self._amp_dtype))
+        return stack
+
+    def _load_backend(self, CrossEncoder):
+        """Load on the requested inference backend, falling back to PyTorch."""
+        if self.backend == "onnx":
+            for file_name in self.ONNX_FILES:
+                try:
+                    return CrossEncoder(
+                        self.model_name, max_length=512, backend="onnx",
+                        model_kwargs={"file_name": file_name}
+                    )
+                except Exception as e:
+                    logger.warning(f"ONNX re-ranker load failed for {file_name} ({e})")
+        elif self.backend == "openvino":
+            try:
+                return CrossEncoder(self.model_name, max_length=512, backend="openvino")
+            except Exception as e:
+                logger.warning(f"OpenVINO re-ranker load failed ({e})")
+
+        if self.backend != "torch":
+            logger.warning("Falling back to PyTorch re-ranker backend")
+            self.backend = "torch"
+        return CrossEncoder(self.model_name, max_length=512, device=self.device)
+
     def rerank(
         self,
         query: str,
         documents: List[Dict[str, Any]],
-        top_k: int = 3
+        top_k: int = 3,
+        batch_size: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         Re-rank documents by cross-encoder relevance score.
@@ -54,6 +139,7 @@ class Reranker:
             query:     The user query string.
             documents: List of dicts with at least a 'text' key.
             top_k:     Number of top documents to return.
+            batch_size: Pairs per forward pass (default: all pairs, up to 64).
 
         Returns:
             Sorted list of documents with added 'rerank_score' key.
@@ -61,26 +147,111 @@ class Reranker:
         if not documents:
             return []
 
+        if len(documents) <= top_k:
+            # Every document is returned anyway; keep the retrieval order
+            for doc in documents:
+                doc.setdefault("rerank_score", doc.get("score", 0.0))
+            return documents
+
         if self._model is None:
             # Fallback: return original order
             logger.warning("Re-ranker unavailable, returning original ranking")
             return documents[:top_k]
 
-        pairs  = [(query, doc["text"]) for doc in documents]
-        scores = self._model.predict(pairs)
+        # Reuse scores for (query, chunk) pairs seen before; predict the rest
+        qh     = hash(query)
+        keys   = [self._cache_key(qh, doc) for doc in documents]
+        scores = [None] * len(documents)
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                if key is not None and key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
 
+        misses = [i for i, score in enumerate(scores) if score is None]
+        if misses:
+            pairs = [(query, documents[i]["text"]) for i in misses]
+            fresh = self._predict(pairs, batch_size or min(len(pairs), 64))
+            with self._cache_lock:
+                for i, score in zip(misses, fresh):
+                    scores[i] = float(score)
+                    if keys[i] is not None:
+                        self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
+
+        # float64 so the rounded values serialise cleanly (0.1234, not 0.12340000271)
+        scores = np.round(np.asarray(scores, dtype=np.float64), 4).tolist()
         for doc, score in zip(documents, scores):
-            doc["rerank_score"] = round(float(score), 4)
+            doc["rerank_score"] = score
 
-        ranked = sorted(documents, key=lambda d: d["rerank_score"], reverse=True)
+        # O(N log k) partial selection; ties keep input order, as sorted() would
+        order  = heapq.nlargest(top_k, range(len(scores)), key=scores.__getitem__)
+        ranked = [documents[i] for i in order]
         logger.info(
             f"Re-ranked {len(documents)} docs → top {top_k} "
+            f"| cache_hits={len(documents) - len(misses)} "
             f"| best_score={ranked[0]['rerank_score'] if ranked else 'N/A'}"
         )
-        return ranked[:top_k]
+        return ranked
+
+    def clear_cache(self):
+        """Drop cached scores (call when stored chunks change)."""
+        with self._cache_lock:
+            self._cache.clear()
+
+    @staticmethod
+    def _cache_key(query_hash: int, doc: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+        """Cache key for a retrieved chunk, or None if it has no stable id."""
+        meta = doc.get("metadata") or {}
+        if "source" not in meta or "chunk_idx" not in meta:
+            return None
+        return (query_hash, f"{meta['source']}:{meta['chunk_idx']}")
+
+    def warmup(self):
+        """
+        Run a dummy batch so lazy session / kernel / CUDA-context init isn't
+        paid by the first request. Called once the model has loaded.
+        """
+        if self._model is None:
+            return
+        try:
+            with self._autocast():
+                self._model.predict(
+                    [("warmup query", "warmup passage")] * 4,
+                    batch_size=4,
+                    show_progress_bar=False
+                )
+        except Exception as e:
+            logger.warning(f"Re-ranker warm-up failed: {e}")
+
+    def _predict(self, pairs: List[Tuple[str, str]], batch_size: int) -> List[float]:
+        """
+        Score pairs with the cross-encoder, batching them longest-first so each
+        padded batch holds similar-length sequences; scores keep input order.
+
+        Pairs are tokenized jointly by predict() (query and passage share one
+        truncated sequence), so per-chunk token ids are not precomputed: the
+        fast tokenizer costs well under 1% of a forward pass, and cached
+        (query, chunk) scores already skip both steps on repeat queries.
+        """
+        # Passage length in chars is a cheap proxy for token count
+        order  = sorted(range(len(pairs)), key=lambda i: len(pairs[i][1]), reverse=True)
+        with self._autocast():
+            sorted_scores = self._model.predict(
+                [pairs[i] for i in order],
+                batch_size=batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+        scores = [0.0] * len(pairs)
+        for k, i in enumerate(order):
+            scores[i] = sorted_scores[k]
+        return scores
 
     def get_model_info(self) -> Dict[str, str]:
         return {
-            "model":  self.model_name,
-            "status": "loaded" if self._model else "fallback"
+            "model":   self.model_name,
+            "backend": self.backend,
+            "status":  "loaded" if self._model else "fallback"
         }
@@ -1,35 +1,422 @@
 """
 Vector Store
 ============
-ChromaDB-backed vector store with SentenceTransformer embeddings.
+ChromaDB-backed vector store with ONNX Runtime (or SentenceTransformer) embeddings.
 Supports multi-collection management, CRUD, and similarity search.
 """
 
+import os
+import json
+import hashlib
+import posixpath
+import shutil
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Union, Iterable, Tuple
+
+import numpy as np
+
+try:
+    from chromadb import EmbeddingFunction
+except ImportError:   # reported with install instructions by VectorStore._init
+    EmbeddingFunction = object
+
 from utils.document_processor import DocumentChunk
+from utils.quantized_index import PQIndex
 
 logger = logging.getLogger(__name__)
 
+SourceFilter = Union[str, Iterable[str]]
+
+
+@lru_cache(maxsize=256)
+def _source_where(sources: Tuple[str, ...]) -> Dict[str, Any]:
+    """Chroma where-clause for a canonical (sorted, de-duplicated) source tuple."""
+    if len(sources) == 1:
+        return {"source": sources[0]}
+    # $in lets Chroma pre-filter by metadata before the HNSW walk
+    return {"source": {"$in": list(sources)}}
+
+
+def build_source_where(source_filter: Optional[SourceFilter]) -> Optional[Dict[str, Any]]:
+    """
+    Where-clause for one source or a collection of sources (None = no filter).
+    Clauses are cached per filter; treat the returned dict as read-only.
+    """
+    if not source_filter:
+        return None
+    if isinstance(source_filter, str):
+        return _source_where((source_filter,))
+    sources = tuple(sorted(set(source_filter)))
+    return _source_where(sources) if sources else None
+
+
+def _is_not_found(error: Exception) -> bool:
+    """True if a Chroma lookup failed only because the collection doesn't exist."""
+    import chromadb.errors as errors
+    # 1.x: NotFoundError; 0.5–0.6: InvalidCollectionException
+    types = tuple(
+        getattr(errors, name) for name in ("NotFoundError", "InvalidCollectionException")
+        if hasattr(errors, name)
+    )
+    if types and isinstance(error, types):
+        return True
+    # 0.4.x: bare ValueError("Collection ... does not exist.")
+    return isinstance(error, ValueError) and "does not exist" in str(error)
+
+
+class SentenceTransformerEmbedder(EmbeddingFunction):
+    """
+    ChromaDB-compatible embedding function backed by SentenceTransformer.
+    Owning the model (rather than using Chroma's built-in wrapper) lets the
+    store control encode() batching and embed whole ingestion batches in one
+    vectorised pass.
+
+    With backend="onnx" the model runs on ONNX Runtime, trying the Hub's
+    int8-quantised export first; the output space (384-d for MiniLM) is the
+    same as the PyTorch model, so existing collections stay compatible.
+    """
+
+    # Tried in order; O3 is the best graph-optimised export that runs on CPU
+    ONNX_FILES = ["onnx/model_qint8_avx512_vnni.onnx", "onnx/model_O3.onnx"]
+
+    def __init__(self, model_name: str, batch_size: int = 64, backend: str = "onnx"):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.backend    = backend
+        self._model     = self._load_model()
+
+    def _load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "onnx":
+            for file_name in self.ONNX_FILES:
+                try:
+                    model = SentenceTransformer(
+                        self.model_name,
+                        backend="onnx",
+                        model_kwargs={
+                            "file_name":       file_name,
+                            "provider":        "CPUExecutionProvider",
+                            "session_options": self._session_options()
+                        }
+                    )
+                    logger.info(f"Embedding model on ONNX Runtime: {file_name}")
+                    return model
+                except Exception as e:
+                    logger.warning(f"ONNX embedding load failed for {file_name} ({e})")
+            logger.warning("Falling back to PyTorch embedding backend")
+
+        return SentenceTransformer(self.model_name)
+
+    @staticmethod
+    def _session_options():
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = os.cpu_count() or 1
+        return opts
+
+    @property
+    def dimension(self) -> int:
+        return self._model.get_sentence_embedding_dimension()
+
+    @property
+    def lowercases(self) -> bool:
+        """True if the tokenizer lower-cases input, so case can't change the vector."""
+        return bool(getattr(getattr(self._model, "tokenizer", None), "do_lower_case", False))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        # Unit-length output: cosine similarity reduces to a dot product
+        return self._model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.encode(input).tolist()
+
+    @staticmethod
+    def name() -> str:
+        return "rag_sentence_transformer"
+
+    def is_legacy(self) -> bool:
+        # No persisted EF config: the store picks its encoder at start-up
+        # (with fallbacks), so Chroma must not pin one to the collection.
+        return True
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction):
+    """
+    ChromaDB-compatible embedding function that runs a mean-pooling encoder
+    (e.g. all-MiniLM-L6-v2) directly on ONNX Runtime via Optimum, with full
+    graph optimisation. Pooling and L2-normalisation are done in NumPy, so
+    no torch tensors are created on the encode path.
+
+    Exposes the same dimension / lowercases / encode() / __call__ interface as
+    SentenceTransformerEmbedder, which remains the fallback.
+
+    With quantize=True the fp32 export is dynamically quantized to int8
+    (AVX-512 VNNI) by ORTQuantizer on first load and cached in quantized_dir;
+    later loads reuse the cached model. The cache is built in a temp dir and
+    renamed into place, and an unreadable cache is deleted and rebuilt.
+    """
+
+    FP32_FILE      = "onnx/model.onnx"
+    # Tried in order when no local quantized model is available
+    ONNX_FILES     = ["onnx/model_qint8_avx512_vnni.onnx", FP32_FILE]
+    QUANTIZED_FILE = "model_quantized.onnx"   # ORTQuantizer's output name
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 64,
+        max_length: int = 256,
+        quantize: bool = True,
+        quantized_dir: Optional[str] = None
+    ):
+        self.model_name    = model_name
+        self.batch_size    = batch_size
+        self.max_length    = max_length   # all-MiniLM-L6-v2's max_seq_length
+        self.quantize      = quantize
+        self.quantized_dir = quantized_dir
+        self._tokenizer    = None
+        self._model        = None
+        self._load_model()
+
+    def _load_model(self):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        if self.quantize and self.quantized_dir:
+            try:
+                self._model = self._load_quantized(ORTModelForFeatureExtraction)
+                return
+            except Exception as e:
+                logger.warning(f"Local int8 quantization failed ({e}), trying Hub exports")
+
+        last_error = None
+        for file_path in (self.ONNX_FILES if self.quantize else [self.FP32_FILE]):
+            subfolder, file_name = posixpath.split(file_path)
+            try:
+                self._model = ORTModelForFeatureExtraction.from_pretrained(
+                    self.model_name,
+                    subfolder=subfolder,
+                    file_name=file_name,
+                    provider="CPUExecutionProvider",
+                    session_options=self._session_options()
+                )
+                logger.info(f"Embedding model on Optimum/ONNX Runtime: {file_path}")
+                return
+            except Exception as e:
+                logger.warning(f"Optimum embedding load failed for {file_path} ({e})")
+                last_error = e
+        raise RuntimeError(f"No ONNX export of {self.model_name} could be loaded: {last_error}")
+
+    def _load_quantized(self, ORTModelForFeatureExtraction):
+        """Load the cached int8 model, quantizing the fp32 export first if needed."""
+        if os.path.isdir(self.quantized_dir):
+            try:
+                return self._open_quantized(ORTModelForFeatureExtraction)
+            except Exception as e:
+                # Unreadable (e.g. half-written by an older version): rebuild it
+                logger.warning(f"Discarding int8 model cache {self.quantized_dir} ({e})")
+                shutil.rmtree(self.quantized_dir, ignore_errors=True)
+
+        self._quantize_to_cache(ORTModelForFeatureExtraction)
+        try:
+            return self._open_quantized(ORTModelForFeatureExtraction)
+        except Exception:
+            shutil.rmtree(self.quantized_dir, ignore_errors=True)
+            raise
+
+    def _quantize_to_cache(self, ORTModelForFeatureExtraction):
+        """Quantize the fp32 export into a temp dir, then move it into place whole."""
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        tmp_dir = f"{self.quantized_dir}.{os.getpid()}.tmp"   # per-process, so workers never share it
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        subfolder, file_name = posixpath.split(self.FP32_FILE)
+        fp32 = ORTModelForFeatureExtraction.from_pretrained(
+            self.model_name, subfolder=subfolder, file_name=file_name
+        )
+        try:
+            ORTQuantizer.from_pretrained(fp32).quantize(
+                save_dir=tmp_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(
+                    is_static=False, per_channel=False
+                )
+            )
+            fp32.config.save_pretrained(tmp_dir)
+            try:
+                os.replace(tmp_dir, self.quantized_dir)
+            except OSError:
+                if not os.path.isdir(self.quantized_dir):
+                    raise
+                # Another worker published its copy first; use that one
+                logger.info(f"Using the int8 model another worker cached in {self.quantized_dir}")
+                return
+            logger.info(f"Quantized {self.model_name} to int8 → {self.quantized_dir}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _open_quantized(self, ORTModelForFeatureExtraction):
+        path  = os.path.join(self.quantized_dir, self.QUANTIZED_FILE)
+        model = ORTModelForFeatureExtraction.from_pretrained(
+            self.quantized_dir,
+            file_name=self.QUANTIZED_FILE,
+            provider="CPUExecutionProvider",
+            session_options=self._session_options()
+        )
+        logger.info(f"Embedding model on Optimum/ONNX Runtime: {path}")
+        return model
+
+    @staticmethod
+    def _session_options():
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads     = os.cpu_count() or 1
+        return opts
+
+    @property
+    def dimension(self) -> int:
+        return self._model.config.hidden_size
+
+    @property
+    def lowercases(self) -> bool:
+        """True if the tokenizer lower-cases input, so case can't change the vector."""
+        return bool(getattr(self._tokenizer, "do_lower_case", False))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        out = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self._tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            hidden = self._model(**inputs).last_hidden_state
+            # Mean-pool over real tokens, then unit-normalise (dot == cosine)
+            mask   = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            out.append(pooled.astype(np.float32))
+        return np.concatenate(out)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.encode(input).tolist()
+
+    @staticmethod
+    def name() -> str:
+        return "rag_onnx_minilm"
+
+    def is_legacy(self) -> bool:
+        # Same as SentenceTransformerEmbedder: this class may fall back to
+        # that one between restarts, so no EF config is persisted.
+        return True
+
+
+Embedder = Union[OnnxEmbeddingFunction, SentenceTransformerEmbedder]
+
 
 class VectorStore:
     """
-    Wraps ChromaDB with a SentenceTransformer embedding function.
+    Wraps ChromaDB with an Optimum/ONNX Runtime embedding function
+    (OnnxEmbeddingFunction), falling back to SentenceTransformerEmbedder
+    when Optimum is unavailable or embedding_backend isn't "onnx".
     Uses a single 'rag_documents' collection with source-level metadata.
+
+    Optionally a separate, much cheaper `query_model` (e.g. a static /
+    Model2Vec-style distillation of the document model) embeds queries, while
+    the full model keeps embedding documents at ingest time. The query model
+    must be trained into the document model's vector space; it is used as-is.
+
+    With `compressed_index="ivfpq"` a Faiss IVF-PQ index (trained once 10k
+    vectors exist) answers unfiltered queries. It is an extra copy on top of
+    Chroma's float32 HNSW index, so it adds RAM (about 1⁄32 of the float32
+    vectors) rather than reducing it. Chroma stays the source of truth for
+    documents, metadata and filtered search.
+
+    With `quantize=True` (default) the document encoder runs an int8 model
+    quantized locally on first start and kept under
+    `{persist_directory}/onnx_int8/`.
+
+    With `in_memory=True` the collection is copied into an in-process
+    EphemeralClient at start-up and all reads are served from it; writes go
+    to both, and reload() re-copies from disk.
+
+    The hnsw_* arguments tune the HNSW graph (M, ef_construction, ef_search,
+    write batching). Chroma fixes them when the collection is created, so
+    they have no effect on an existing collection.
     """
 
-    COLLECTION_NAME = "rag_documents"
+    COLLECTION_NAME  = "rag_documents"
+    STAGING_NAME     = "rag_documents_migrating"   # re-indexed copy during a migration
+    BACKUP_NAME      = "rag_documents_legacy"      # legacy collection until the swap is done
+    INDEX_VERSION    = 2      # 2: L2-normalised vectors in an inner-product HNSW space
+    QUERY_CACHE_SIZE = 1024   # cached query embeddings (LRU)
+    INDEX_PAGE_SIZE  = 5000   # rows per page when loading the compressed index
+    UPSERT_BATCH     = 256    # chunks per length-sorted upsert
+    SOURCES_FILE     = "sources.json"   # sidecar listing stored source names
+    MIRROR_PAGE_SIZE = 10000  # rows per page when copying into the in-memory mirror
 
     def __init__(
         self,
         persist_directory: str = "./vector_db",
-        embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+        embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+        embedding_backend: str = "onnx",
+        query_model: Optional[str] = None,
+        compressed_index: Optional[str] = None,
+        quantize: bool = True,
+        in_memory: bool = False,
+        hnsw_m: int = 24,
+        hnsw_construction_ef: int = 128,
+        hnsw_search_ef: int = 100,
+        hnsw_batch_size: int = 128,
+        hnsw_sync_threshold: int = 1000
     ):
         self.persist_directory = persist_directory
         self.embedding_model   = embedding_model
+        self.embedding_backend = embedding_backend
+        self.query_model       = query_model
+        self.compressed_index  = compressed_index
+        self.quantize          = quantize
+        self.in_memory         = in_memory
+        self.hnsw_params       = {
+            "hnsw:M":               hnsw_m,
+            "hnsw:construction_ef": hnsw_construction_ef,
+            "hnsw:search_ef":       hnsw_search_ef,
+            "hnsw:batch_size":      hnsw_batch_size,
+            "hnsw:sync_threshold":  hnsw_sync_threshold
+        }
         self._client     = None
         self._collection = None
+        self._mirror     = None   # in-memory copy of the collection (in_memory=True)
         self._ef         = None
+        self._query_ef   = None
+        self._cindex     = None
+        self._doc_count  = 0   # cached collection.count(), refreshed on writes
+        self._sources: set = set()
+        self._sources_lock = threading.Lock()
+        # Serialises writes with reload(), so none lands in a mirror that is being replaced
+        self._write_lock   = threading.Lock()
+        # blake2b(normalised query) → L2-normalised embedding
+        self._query_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
         self._init()
 
     # ── Initialisation ─────────────────────────────────────────────────────────
@@ -37,96 +424,532 @@ class VectorStore:
     def _init(self):
         try:
             import chromadb
-            from chromadb.utils import embedding_functions
 
             self._client = chromadb.PersistentClient(path=self.persist_directory)
-            self._ef     = embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name=self.embedding_model
-            )
-            self._collection = self._client.get_or_create_collection(
-                name=self.COLLECTION_NAME,
-                embedding_function=self._ef,
-                metadata={"hnsw:space": "cosine"}
-            )
+            self._ef     = self._load_embedder()
+            self._query_ef = self._load_query_encoder()
+            self._collection = self._open_collection()
+            self._doc_count = self._collection.count()
+            self._sources   = self._load_sources()
+            self._mirror    = self._build_memory_mirror()
+            self._cindex    = self._build_compressed_index()
+            self.warmup()
             logger.info(
-                f"VectorStore ready: {self._collection.count()} docs | "
-                f"model={self.embedding_model}"
+                f"VectorStore ready: {self._doc_count} docs | "
+                f"model={self.embedding_model} | backend={self.embedding_backend}"
             )
         except ImportError:
             raise ImportError("Install chromadb & sentence-transformers: "
                               "pip install chromadb sentence-transformers")
 
+    def _collection_metadata(self) -> Dict[str, Any]:
+        # Vectors are L2-normalised, so inner product == cosine.
+        # HNSW params only apply when the collection is first created.
+        return {"hnsw:space": "ip", "index_version": self.INDEX_VERSION, **self.hnsw_params}
+
+    def _open_collection(self):
+        """Open (or create) the collection, re-indexing a legacy one if needed."""
+        try:
+            # Looked up first: get_or_create_collection may overwrite the
+            # stored metadata, which would hide a legacy distance space
+            collection = self._client.get_collection(
+                name=self.COLLECTION_NAME, embedding_function=self._ef
+            )
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            collection = self._resume_migration()
+            if collection is not None:
+                return collection
+            return self._client.create_collection(
+                name=self.COLLECTION_NAME,
+                embedding_function=self._ef,
+                metadata=self._collection_metadata()
+            )
+
+        meta = collection.metadata or {}
+        if meta.get("index_version", 0) < self.INDEX_VERSION and meta.get("hnsw:space", "l2") != "ip":
+            return self._migrate_collection(collection)
+        self._drop_collection(self.BACKUP_NAME)   # left if a swap stopped just before cleanup
+        return collection
+
+    def _get_collection_or_none(self, name: str):
+        try:
+            return self._client.get_collection(name=name, embedding_function=self._ef)
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            return None
+
+    def _drop_collection(self, name: str):
+        try:
+            self._client.delete_collection(name)
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+
+    def _resume_migration(self):
+        """
+        Finish a migration interrupted between its two renames, when the
+        legacy data lives on as BACKUP_NAME. None if there is nothing to resume.
+        """
+        backup = self._get_collection_or_none(self.BACKUP_NAME)
+        if backup is None:
+            return None
+        staging = self._get_collection_or_none(self.STAGING_NAME)
+        if staging is None:
+            # Not expected (staging is complete before the backup rename), but
+            # never drop data: restore the legacy collection and migrate afresh
+            backup.modify(name=self.COLLECTION_NAME)
+            return self._migrate_collection(backup)
+
+        # The backup rename only happens once staging holds every chunk
+        staging.modify(name=self.COLLECTION_NAME)
+        self._drop_collection(self.BACKUP_NAME)
+        logger.info(f"Resumed interrupted migration: {staging.count()} chunks")
+        return staging
+
+    def _migrate_collection(self, legacy):
+        """
+        One-time re-index of a pre-v2 (cosine / l2) collection into the
+        inner-product space. Vectors are copied, not re-embedded, into a
+        staging collection. Once complete, the legacy collection is renamed
+        to BACKUP_NAME, staging takes its name, and only then is the backup
+        deleted, so a crash at any point leaves the data recoverable.
+        """
+        self._drop_collection(self.STAGING_NAME)   # left by an interrupted copy
+        staging = self._client.create_collection(
+            name=self.STAGING_NAME,
+            embedding_function=self._ef,
+            metadata=self._collection_metadata()
+        )
+
+        space  = (legacy.metadata or {}).get("hnsw:space", "l2")
+        offset = 0
+        while True:
+            page = legacy.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=self.INDEX_PAGE_SIZE, offset=offset
+            )
+            if not page["ids"]:
+                break
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            staging.add(
+                ids=page["ids"],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+                embeddings=vectors.tolist()
+            )
+            offset += len(page["ids"])
+
+        legacy.modify(name=self.BACKUP_NAME)
+        staging.modify(name=self.COLLECTION_NAME)
+        self._drop_collection(self.BACKUP_NAME)
+        logger.info(
+            f"Migrated {offset} chunks from hnsw:space={space} to ip "
+            f"(index_version={self.INDEX_VERSION})"
+        )
+        return staging
+
+    @property
+    def _reader(self):
+        """Collection that serves reads: the in-memory mirror when enabled."""
+        return self._mirror if self._mirror is not None else self._collection
+
+    def _writers(self) -> list:
+        """Collections every write must reach."""
+        return [self._collection] + ([self._mirror] if self._mirror is not None else [])
+
+    def _build_memory_mirror(self):
+        """Copy the persistent collection into an in-process EphemeralClient."""
+        if not self.in_memory:
+            return None
+        import chromadb
+
+        # Unique name: reload() builds the new copy while the old one still serves reads
+        mirror = chromadb.EphemeralClient().create_collection(
+            name=f"{self.COLLECTION_NAME}_{uuid.uuid4().hex[:8]}",
+            embedding_function=self._ef,
+            metadata=self._collection_metadata()
+        )
+        offset = 0
+        while True:
+            page = self._collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=self.MIRROR_PAGE_SIZE, offset=offset
+            )
+            if not page["ids"]:
+                break
+            mirror.add(
+                ids=page["ids"],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+                embeddings=np.asarray(page["embeddings"], dtype=np.float32).tolist()
+            )
+            offset += len(page["ids"])
+
+        logger.info(f"In-memory mirror ready: {offset} chunks")
+        return mirror
+
+    def _load_embedder(self) -> Embedder:
+        """Document encoder: Optimum/ORT for backend="onnx", SentenceTransformer otherwise."""
+        if self.embedding_backend == "onnx":
+            try:
+                return OnnxEmbeddingFunction(
+                    self.embedding_model,
+                    quantize=self.quantize,
+                    # One sub-directory per model so switching models never reuses a stale file
+                    quantized_dir=os.path.join(
+                        self.persist_directory, "onnx_int8", self.embedding_model.replace("/", "__")
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Optimum embedding function unavailable ({e}), "
+                               f"using SentenceTransformer")
+        return SentenceTransformerEmbedder(self.embedding_model, backend=self.embedding_backend)
+
+    def _load_query_encoder(self) -> Embedder:
+        """Return the query-side encoder (the document encoder unless overridden)."""
+        if not self.query_model:
+            return self._ef
+        try:
+            # Static embedding models have no transformer graph to export
+            query_ef = SentenceTransformerEmbedder(self.query_model, backend="torch")
+        except Exception as e:
+            logger.warning(f"Query model load failed ({e}), using document encoder")
+            return self._ef
+
+        if query_ef.dimension != self._ef.dimension:
+            logger.warning(
+                f"Query model '{self.query_model}' has dim {query_ef.dimension}, "
+                f"document model has {self._ef.dimension}; using document encoder"
+            )
+            return self._ef
+
+        logger.info(f"Query encoder: {self.query_model}")
+        return query_ef
+
+    def _read_sources_file(self) -> Optional[set]:
+        """Source names in the sidecar, or None if it is missing / unreadable."""
+        path = os.path.join(self.persist_directory, self.SOURCES_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return set(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, TypeError, ValueError) as e:   # TypeError: not a JSON list
+            logger.warning(f"Unreadable {self.SOURCES_FILE} ({e}), rebuilding it")
+            return None
+
+    def _load_sources(self) -> set:
+        """Read the source-name sidecar, rebuilding it from metadata if missing."""
+        sources = self._read_sources_file()
+        if sources is not None:
+            return sources
+
+        sources = set()
+        if self._doc_count:
+            results = self._collection.get(include=["metadatas"])
+            sources = {m.get("source", "unknown") for m in results["metadatas"]}
+        self._save_sources(sources)
+        return sources
+
+    def _update_sources(self, added: Iterable[str] = (), removed: Iterable[str] = ()):
+        """
+        Apply source additions / removals, merging with the sidecar on disk so
+        changes written by other processes sharing the store are kept. The
+        read-merge-write is not locked across processes, so the sidecar is a
+        listing hint only; delete_source() checks Chroma itself.
+        """
+        with self._sources_lock:
+            # Only this call's delta is applied, so other writers' changes survive
+            base   = self._read_sources_file()
+            merged = ((self._sources if base is None else base) | set(added)) - set(removed)
+            self._save_sources(merged)
+            self._sources = merged
+
+    def _save_sources(self, sources: set):
+        """Atomically rewrite the source-name sidecar."""
+        path = os.path.join(self.persist_directory, self.SOURCES_FILE)
+        tmp  = f"{path}.{os.getpid()}.tmp"   # per-process, so writers never share it
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(sorted(sources), f)
+        os.replace(tmp, path)
+
+    def _build_compressed_index(self) -> Optional[PQIndex]:
+        """Load every stored vector into the configured compressed index."""
+        if not self.compressed_index:
+            return None
+        if self.compressed_index == "ivfpq":
+            try:
+                index = PQIndex(self._ef.dimension)
+            except ImportError:
+                logger.warning("compressed_index='ivfpq' needs faiss: pip install faiss-cpu; ignoring")
+                return None
+        else:
+            logger.warning(f"Unknown compressed_index '{self.compressed_index}', ignoring")
+            return None
+
+        offset = 0
+        while True:
+            page = self._reader.get(
+                include=["embeddings"], limit=self.INDEX_PAGE_SIZE, offset=offset
+            )
+            if not page["ids"]:
+                break
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            index.add(page["ids"], vectors)
+            offset += len(page["ids"])
+
+        logger.info(f"Compressed index ({self.compressed_index}) ready: {len(index)} vectors")
+        return index
+
+    def _search_compressed(self, query_vec: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """Top-k via the compressed index; documents/metadata fetched from Chroma."""
+        matches = self._cindex.search(query_vec, top_k)
+        if not matches:
+            return []
+        ids     = [doc_id for doc_id, _ in matches]
+        results = self._reader.get(ids=ids, include=["documents", "metadatas"])
+        by_id   = {
+            doc_id: (doc, meta)
+            for doc_id, doc, meta in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+        return [
+            {"text": by_id[doc_id][0], "metadata": by_id[doc_id][1], "score": round(score, 4)}
+            for doc_id, score in matches
+            if doc_id in by_id
+        ]
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, serving repeated (normalised) queries from an LRU cache."""
+        return self._embed_queries([query])[0]
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed several queries; cache misses are encoded in one batched pass."""
+        # Only fold case when the query tokenizer does (e.g. uncased MiniLM);
+        # cased tokenizers give different vectors for "Apple" and "apple"
+        fold = str.lower if self._query_ef.lowercases else str
+        keys = [hashlib.blake2b(fold(q.strip()).encode(), digest_size=16).digest() for q in queries]
+        vecs: List[Optional[np.ndarray]] = [None] * len(queries)
+        with self._query_cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._query_cache.get(key)
+                if cached is not None:
+                    self._query_cache.move_to_end(key)
+                    vecs[i] = cached
+
+        misses = [i for i, vec in enumerate(vecs) if vec is None]
+        if misses:
+            embeddings = np.asarray(
+                self._query_ef.encode([queries[i] for i in misses]), dtype=np.float32
+            )
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            with self._query_cache_lock:
+                for i, embedding in zip(misses, embeddings):
+                    vecs[i] = embedding
+                    self._query_cache[keys[i]] = embedding
+                while len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        return np.stack(vecs)
+
     # ── Public API ─────────────────────────────────────────────────────────────
 
+    def warmup(self):
+        """
+        Run a dummy encode so lazy model/session init isn't paid by the first
+        request. Called at the end of initialisation.
+        """
+        try:
+            self._ef.encode(["warmup"])
+            if self._query_ef is not self._ef:
+                self._query_ef.encode(["warmup"])
+        except Exception as e:
+            logger.warning(f"Embedding warm-up failed: {e}")
+
+    @staticmethod
+    def chunk_id(source: str, chunk_idx: int) -> str:
+        """Stable ID for a chunk (re-ingesting a source overwrites its chunks)."""
+        return f"{source}_chunk_{chunk_idx}"
+
     def add_documents(self, chunks: List[DocumentChunk], source: str):
         """Embed and store document chunks."""
         if not chunks:
             return
 
         # Build unique IDs (avoid collisions on re-ingestion)
-        ids       = [f"{source}_chunk_{c.metadata['chunk_idx']}" for c in chunks]
+        ids       = [self.chunk_id(source, c.metadata["chunk_idx"]) for c in chunks]
         documents = [c.text for c in chunks]
         metadatas = [c.metadata for c in chunks]
 
-        # Upsert to handle re-ingestion gracefully
-        self._collection.upsert(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
-        )
+        self.add_documents_batch(documents, metadatas, ids)
         logger.info(f"Upserted {len(chunks)} chunks from '{source}'")
 
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed many texts in one vectorised encoder pass. Texts are encoded
+        shortest-first so each padded mini-batch holds similar lengths; rows
+        come back in input order.
+        """
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        embeddings = np.asarray(self._ef.encode([texts[i] for i in order]), dtype=np.float32)
+        out = np.empty_like(embeddings)
+        out[order] = embeddings
+        return out
+
+    def add_documents_batch(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: Optional[np.ndarray] = None
+    ):
+        """
+        Store a pre-assembled batch of chunks (possibly spanning several
+        sources). Chunks are written in length-sorted sub-batches of
+        UPSERT_BATCH, so any chunks that still need embedding are encoded
+        with little padding; ids stay paired with their own vectors.
+        """
+        if not texts:
+            return
+
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        with self._write_lock:
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            for start in range(0, len(order), self.UPSERT_BATCH):
+                idx       = order[start:start + self.UPSERT_BATCH]
+                sub_texts = [texts[i] for i in idx]
+                sub_ids   = [ids[i] for i in idx]
+                sub_embs  = embeddings[idx] if embeddings is not None else self.embed_batch(sub_texts)
+
+                # Upsert to handle re-ingestion gracefully
+                sub_metas = [metadatas[i] for i in idx]
+                sub_list  = sub_embs.tolist()
+                for collection in self._writers():
+                    collection.upsert(
+                        ids=sub_ids,
+                        documents=sub_texts,
+                        metadatas=sub_metas,
+                        embeddings=sub_list
+                    )
+                if self._cindex is not None:
+                    self._cindex.add(sub_ids, sub_embs)
+            # Upserts may overwrite existing ids, so re-read rather than add len(texts)
+            self._doc_count = self._collection.count()
+
+            # Always merged: self._sources may be stale if another process
+            # deleted one of these sources since this one last read the sidecar
+            self._update_sources(added={m.get("source", "unknown") for m in metadatas})
+        logger.info(f"Upserted batch of {len(texts)} chunks")
+
     def similarity_search(
         self,
         query: str,
         top_k: int = 5,
-        source_filter: Optional[str] = None
+        source_filter: Optional[SourceFilter] = None
     ) -> List[Dict[str, Any]]:
-        """Return top-k similar chunks with distance scores."""
-        where = {"source": source_filter} if source_filter else None
+        """
+        Return top-k similar chunks with distance scores. `source_filter` may
+        be one source name or a list / set of names.
+        """
+        return self.similarity_search_many([query], top_k, source_filter)[0]
+
+    def similarity_search_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        source_filter: Optional[SourceFilter] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Top-k search for several queries at once (e.g. multi-query / HyDE
+        rewrites): queries are embedded in one batch and sent to Chroma in a
+        single query() call. Returns one hit list per query, in order.
+        """
+        if not queries:
+            return []
+        query_vecs = self._embed_queries(queries)
+        where      = build_source_where(source_filter)
+        if self._cindex is not None and where is None:
+            return [self._search_compressed(vec, top_k) for vec in query_vecs]
+
+        # The cached count is per-process: another worker may have ingested since,
+        # so re-read it whenever it would cap the result size
+        if self._doc_count < top_k:
+            self._doc_count = self._collection.count()
 
-        results = self._collection.query(
-            query_texts=[query],
-            n_results=min(top_k, self._collection.count() or 1),
+        results = self._reader.query(
+            query_embeddings=query_vecs.tolist(),
+            n_results=min(top_k, self._doc_count or 1),
             where=where,
             include=["documents", "metadatas", "distances"]
         )
 
         hits = []
-        for doc, meta, dist in zip(
-            results["documents"][0],
-            results["metadatas"][0],
-            results["distances"][0]
+        for docs, metas, dists in zip(
+            results["documents"], results["metadatas"], results["distances"]
         ):
-            hits.append({
-                "text":     doc,
-                "metadata": meta,
-                "score":    round(1 - dist, 4)   # cosine similarity
-            })
+            # cosine (ip distance = 1 - dot); float64 keeps the rounded values clean
+            sims = np.round(1.0 - np.asarray(dists, dtype=np.float64), 4).tolist()
+            hits.append([
+                {"text": doc, "metadata": meta, "score": sim}
+                for doc, meta, sim in zip(docs, metas, sims)
+            ])
         return hits
 
+    def reload(self):
+        """
+        Re-read state from the persistent collection (e.g. after another
+        process wrote to it): count, sources, in-memory mirror and
+        compressed index.
+        """
+        with self._write_lock:
+            old_mirror = self._mirror
+            self._doc_count = self._collection.count()
+            self._sources   = self._load_sources()
+            self._mirror    = self._build_memory_mirror()
+            self._cindex    = self._build_compressed_index()
+        if old_mirror is not None:
+            import chromadb
+            chromadb.EphemeralClient().delete_collection(old_mirror.name)
+        logger.info(f"VectorStore reloaded: {self._doc_count} docs")
+
     def get_doc_count(self) -> int:
-        return self._collection.count()
+        return self._doc_count
 
     def get_collections(self) -> List[str]:
         return [c.name for c in self._client.list_collections()]
 
     def list_sources(self) -> List[str]:
         """Return unique source filenames stored in the DB."""
-        if self._collection.count() == 0:
-            return []
-        results = self._collection.get(include=["metadatas"])
-        sources = {m.get("source", "unknown") for m in results["metadatas"]}
-        return sorted(sources)
+        # The sidecar is tiny; re-reading it picks up other workers' uploads
+        on_disk = self._read_sources_file()
+        if on_disk is not None:
+            self._sources = on_disk
+        return sorted(self._sources)
 
     def delete_source(self, source: str):
         """Delete all chunks belonging to a source document."""
-        results = self._collection.get(
-            where={"source": source},
-            include=["metadatas"]
-        )
-        if results["ids"]:
-            self._collection.delete(ids=results["ids"])
-            logger.info(f"Deleted {len(results['ids'])} chunks for '{source}'")
-        else:
+        # Chroma, not the source sidecar, decides whether the source exists
+        with self._write_lock:
+            where  = {"source": source}
+            before = self._collection.count()
+            if self._cindex is not None:
+                # The compressed index is keyed by id, so fetch ids only (no payload)
+                ids = self._reader.get(where=where, include=[])["ids"]
+                if ids:
+                    for collection in self._writers():
+                        collection.delete(ids=ids)
+                    self._cindex.remove(ids)
+            else:
+                for collection in self._writers():
+                    collection.delete(where=where)
+
+            self._doc_count = self._collection.count()
+            self._update_sources(removed=[source])
+        if self._doc_count == before:
             raise ValueError(f"Source '{source}' not found in vector store")
+        logger.info(f"Deleted {before - self._doc_count} chunks for '{source}'")